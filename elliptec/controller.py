@@ -1,25 +1,53 @@
 """Communicate with a Thorlabs elliptec controller."""
 
-import io
+import json
+import os
 import serial
+import sys
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from enum import IntEnum
+from threading import RLock
 from time import sleep
 
-# Protocol-defined error codes, received from modules
-OK = 0
-COMM_TIMEOUT = 1
-MECH_TIMEOUT = 2
-COMMAND_ERR = 3
-VAL_OUT_OF_RANGE = 4
-MOD_ISOLATED = 5
-MOD_OUT_OF_ISOL = 6
-INIT_ERROR = 7
-THERMAL_ERROR = 8
-BUSY = 9
-SENSOR_ERROR = 10
-MOTOR_ERROR = 11
-OUT_OF_RANGE = 12
-OVER_CURRENT = 13
-GENERAL_ERROR = 14
+
+class Status(IntEnum):
+    """Protocol-defined error codes, received from modules."""
+
+    OK = 0
+    COMM_TIMEOUT = 1
+    MECH_TIMEOUT = 2
+    COMMAND_ERR = 3
+    VAL_OUT_OF_RANGE = 4
+    MOD_ISOLATED = 5
+    MOD_OUT_OF_ISOL = 6
+    INIT_ERROR = 7
+    THERMAL_ERROR = 8
+    BUSY = 9
+    SENSOR_ERROR = 10
+    MOTOR_ERROR = 11
+    OUT_OF_RANGE = 12
+    OVER_CURRENT = 13
+    GENERAL_ERROR = 14
+
+
+# The codes are also available as module-level constants
+OK = Status.OK
+COMM_TIMEOUT = Status.COMM_TIMEOUT
+MECH_TIMEOUT = Status.MECH_TIMEOUT
+COMMAND_ERR = Status.COMMAND_ERR
+VAL_OUT_OF_RANGE = Status.VAL_OUT_OF_RANGE
+MOD_ISOLATED = Status.MOD_ISOLATED
+MOD_OUT_OF_ISOL = Status.MOD_OUT_OF_ISOL
+INIT_ERROR = Status.INIT_ERROR
+THERMAL_ERROR = Status.THERMAL_ERROR
+BUSY = Status.BUSY
+SENSOR_ERROR = Status.SENSOR_ERROR
+MOTOR_ERROR = Status.MOTOR_ERROR
+OUT_OF_RANGE = Status.OUT_OF_RANGE
+OVER_CURRENT = Status.OVER_CURRENT
+GENERAL_ERROR = Status.GENERAL_ERROR
 
 errmsg = {
     OK: "OK, no error",
@@ -52,19 +80,53 @@ flagmsg = {
 CW = 0
 CCW = 1
 
+# Home command for linear and rotary stages by direction
+homecmd = {CW: "ho0", CCW: "ho1"}
+
 # Acceptable accuracy
 DEGERR = 0.1
 MMERR = 0.05
 
+# Commands a pipeline queues before writing them out together
+MAXBATCH = 16
+
+# Moves in a row without a reply before slow_write is switched on
+MISSLIMIT = 2
+
+# Default location of the state saved by Elliptec.savestate
+STATEFILE = os.path.join(os.path.expanduser("~"), ".elliptec_state.json")
+
+# Reply length following the address and reply code, including "\r\n"
+replylen = {
+    b"GS": 4,
+    b"PO": 10,
+    b"HO": 10,
+    b"GJ": 10,
+    b"IN": 32,
+    b"I1": 24,
+    b"I2": 24,
+}
+
+# Fields of the reply to "in": name, slice and number base
+infofields = (
+    ("partnumber", 3, 5, 16),
+    ("serialnumber", 5, 13, 10),
+    ("year", 13, 17, 10),
+    ("fwrel", 17, 19, 10),
+    ("hwrel", 19, 21, 10),
+    ("travel", 21, 25, 16),
+    ("pulses", 25, 33, 16),
+)
+
 # Device ids by module type
 modtype = {
-    "linear": [7, 10, 17, 20],
-    "rotary": [8, 14, 18],
-    "indexed": [6, 9, 12],
-    "optclean": [14, 17, 18, 20],
+    "linear": frozenset([7, 10, 17, 20]),
+    "rotary": frozenset([8, 14, 18]),
+    "indexed": frozenset([6, 9, 12]),
+    "optclean": frozenset([14, 17, 18, 20]),
 }
 # Linear plus rotary stages have same home cmd, same number of motors
-modtype["linrot"] = modtype["linear"] + modtype["rotary"]
+modtype["linrot"] = modtype["linear"] | modtype["rotary"]
 
 
 class Error(Exception):
@@ -99,6 +161,31 @@ class Elliptec:
     perform an intial homing.
     """
 
+    __slots__ = (
+        "ser",
+        "info",
+        "zero",
+        "slow_write",
+        "slow_write_delay",
+        "_missed",
+        "flags",
+        "addrs",
+        "_steps_per_deg",
+        "_steps_per_mm",
+        "_deg_per_step",
+        "_mm_per_step",
+        "_infocache",
+        "_poscache",
+        "_freecache",
+        "_addrstr",
+        "_pending",
+        "_txbuf",
+        "_rxbuf",
+        "_querytimeout",
+        "_executor",
+        "_lock",
+    )
+
     def __init__(
         self,
         dev,
@@ -108,11 +195,44 @@ class Elliptec:
         freqSave=False,
         cal=dict(),
         slow_write=False,
+        info=None,
+        baudrate=9600,
+        slow_write_delay=0.001,
     ):
-        """Initialize communication with controller and home all modules."""
-        self.openserial(dev)
+        """Initialize communication with controller and home all modules.
+
+        If `info` is given, as saved by savestate, the modules are not
+        queried for their information. See fromstate.
+
+        With `home="auto"`, the modules are only homed if any of them
+        reports an error status. Use this only when the modules have stayed
+        powered since they were last homed, as the status does not show
+        whether a module has a datum.
+        """
+        self.openserial(dev, baudrate)
         # info: module/motor info received during init
         self.info = dict()
+        # _steps_per_deg, _steps_per_mm and their inverses: per-module
+        # scale factors from info
+        self._steps_per_deg = dict()
+        self._steps_per_mm = dict()
+        self._deg_per_step = dict()
+        self._mm_per_step = dict()
+        # _infocache: replies to queries that do not change, by (addr, msg)
+        self._infocache = dict()
+        # _poscache: last position reply per module, see pos(cached=True)
+        self._poscache = dict()
+        # _freecache: addresses found to have no module, see _freeaddrs
+        self._freecache = None
+        # _pending: addresses awaiting a reply inside pipeline(), or None
+        self._pending = None
+        # _txbuf: commands queued inside pipeline() but not yet written
+        self._txbuf = []
+        # _executor: worker thread running submit() calls, started on demand
+        self._executor = None
+        # _lock: held while using the port, so submit() calls and direct
+        # calls take turns instead of interleaving their commands
+        self._lock = RLock()
         # zero: per-module user calibration offset
         self.zero = cal
         if not cal:
@@ -120,45 +240,109 @@ class Elliptec:
         else:
             dozero = False
         self.slow_write = slow_write
+        # Pause before each character with slow_write, in seconds
+        self.slow_write_delay = slow_write_delay
+        # Moves in a row that got no reply, see MISSLIMIT
+        self._missed = 0
         # Collect soft errors ("flags") when it's possible to retry a
         # command, for printing if eventually unsuccessful
         self.flags = []
-        self.ser.timeout = 6
-        self.addrs = [self.parseaddr(addr) for addr in addrs]
-        # Sorting fixes a bug where some misbehaving modules do not reply to
-        # the information query during initialization on OSX.
-        self.addrs.sort()
-        for addr in addrs:
-            info = self.information(addr)
-            if not info:
-                raise MissingModule(
-                    f"Address {addr}: no module found or it failed to reply"
-                )
+        # Modules answer queries at once, so a missing one is found out
+        # quickly instead of waiting out the timeout needed for motion
+        with self._timeout(self._querytimeout):
+            self.addrs = [self.parseaddr(addr) for addr in addrs]
+            # Sorting fixes a bug where some misbehaving modules do not reply to
+            # the information query during initialization on OSX.
+            self.addrs.sort()
+            # Address prefix sent with each command, computed once per module
+            self._addrstr = {addr: str(int(addr, 16)) for addr in self.addrs}
+            if info is not None:
+                for addr in self.addrs:
+                    self.storeinfo(addr, dict(info[addr]))
+                infos = []
             else:
+                # Query every module before reading any reply, and fall back to
+                # a single query for any module whose reply was lost
+                infos = self.batchmsg(self.addrs, ["in"] * len(self.addrs))
+            for addr, info in zip(self.addrs, infos):
+                info = self.handler(info)
+                if not self.isinfo(info):
+                    info = self.information(addr)
+                if not self.isinfo(info):
+                    raise MissingModule(
+                        f"Address {addr}: no module found or it failed to reply"
+                    )
+                self._infocache[(addr, "in")] = info
                 self.initinfo(addr, info)
-                # The (second) initial frequency scan's result is not
-                # saved by default
-                if freq:
-                    self.searchfreq(addr)
-                    if freqSave:
-                        self.saveuserdata(addr)
-                # An initial homing must be performed to establish a
-                # datum for subsequent moving
-                if home:
-                    self.home(addr)
-                # Initialize the calibration offset if none is provided
-                if dozero:
+        with self._timeout(6):
+            # The (second) initial frequency scan's result is not
+            # saved by default
+            if freq:
+                self.searchfreqall()
+                if freqSave:
+                    self.batchmsg(self.addrs, ["us"] * len(self.addrs))
+            # Initialize the calibration offset if none is provided
+            if dozero:
+                for addr in self.addrs:
                     self.zero[addr] = 0
-        self.ser.timeout = 2
+            if home == "auto":
+                statuses = self.batchmsg(self.addrs, ["gs"] * len(self.addrs))
+                home = not all(
+                    self.isstatus(r) and self.parsestatus(r) == OK for r in statuses
+                )
+            # An initial homing must be performed to establish a
+            # datum for subsequent moving
+            if home:
+                self.homeall()
+
+    @classmethod
+    def fromstate(cls, dev, path=STATEFILE, **kwargs):
+        """Reconnect to modules using the state saved by savestate.
+
+        The module information and calibration offsets are read from
+        `path` instead of querying the modules, and the initial frequency
+        search and homing are skipped. This is only valid if the modules
+        have stayed powered and have not been moved by anything else since
+        the state was saved, so that their datum is still good. Keyword
+        arguments are passed on to the constructor and override the saved
+        values, e.g. `cal` for new calibration offsets.
+        """
+        with open(path) as f:
+            state = json.load(f)
+        kwargs.setdefault("cal", state["zero"])
+        kwargs.setdefault("info", state["info"])
+        kwargs.setdefault("home", False)
+        kwargs.setdefault("freq", False)
+        return cls(dev, state["addrs"], **kwargs)
+
+    def savestate(self, path=STATEFILE):
+        """Save module information and calibration offsets for fromstate."""
+        state = {
+            "addrs": self.addrs,
+            "info": {
+                addr: {k: v for k, v in self.info[addr].items() if type(k) is str}
+                for addr in self.addrs
+            },
+            "zero": self.zero,
+        }
+        with open(path, "w") as f:
+            json.dump(state, f, indent=4)
 
     @staticmethod
     def parseaddr(addr):
         """Converts integer addresses to hex format supported by controller."""
         if type(addr) is int:
-            return hex(addr)[2:].upper()
+            return format(addr, "X")
         else:
             return addr
 
+    def _addrprefix(self, addr):
+        """Return the prefix sent ahead of commands to module at addr."""
+        prefix = self._addrstr.get(addr)
+        if prefix is None:
+            prefix = str(int(addr, 16))
+        return prefix
+
     def handler(self, retval):
         """Process replies from modules.
 
@@ -167,66 +351,374 @@ class Elliptec:
         """
         return retval
 
+    def _readmsg(self):
+        """Read a single reply from the modules.
+
+        Everything already waiting in the OS buffer is read in one call and
+        kept in a receive buffer, so the replies to a batch of commands that
+        arrive back-to-back are collected together rather than one blocking
+        read at a time. When the rest of a reply is known from its reply
+        code, at least that much is requested at once.
+        """
+        buf = self._rxbuf
+        end = buf.find(b"\r\n")
+        while end < 0:
+            if len(buf) < 3:
+                need = 3 - len(buf)
+            else:
+                need = 3 + replylen.get(bytes(buf[1:3]), 0) - len(buf)
+            data = self.ser.read(max(need, self.ser.in_waiting, 1))
+            if not data:
+                # Timed out, return whatever arrived
+                msg = bytes(buf)
+                buf.clear()
+                return msg.decode("ascii")
+            # Only the new bytes (and a trailing "\r") need searching
+            start = max(len(buf) - 1, 0)
+            buf += data
+            end = buf.find(b"\r\n", start)
+        msg = bytes(buf[: end + 2])
+        del buf[: end + 2]
+        return msg.decode("ascii")
+
     def _readmsgs(self, count):
         """Collect the expected number of replies from the modules."""
         msgs = []
         for i in range(count):
-            msgs.append(self.ser.readline().decode())
+            msgs.append(self._readmsg())
         return msgs
 
+    def _matchmsgs(self, addrs, count, wait=False):
+        """Collect `count` replies and match them to `addrs` by address.
+
+        Replies from different modules may arrive in any order, but each
+        one starts with the address of the module that sent it. Returns
+        the replies in the order of `addrs`, with an empty string for a
+        module that did not reply. With `wait`, busy status replies are
+        passed over in favour of the reply sent when the command finishes.
+        """
+        ret = [""] * len(addrs)
+        done = [False] * len(addrs)
+        with self._lock:
+            while count:
+                msg = self._readmsg()
+                if not msg:
+                    break
+                busy = wait and self.isbusy(msg)
+                if not busy:
+                    count -= 1
+                for i, addr in enumerate(addrs):
+                    if not done[i] and msg[:1] == addr:
+                        ret[i] = msg
+                        done[i] = not busy
+                        break
+        return ret
+
+    def _waitmove(self, retval):
+        """Wait past busy status replies for the reply ending a motion.
+
+        A module that is still moving may reply with a busy status before
+        the position reply sent when it stops. The last busy reply is
+        returned if nothing follows before the timeout. None, as returned
+        by msg() inside a pipeline, is passed through.
+        """
+        if retval is None:
+            return None
+        while self.isbusy(retval):
+            msg = self._readmsg()
+            if not msg:
+                break
+            retval = msg
+        return retval
+
     def clearmsgs(self):
-        """Clear message backlog until serial timeout is reached."""
-        retval = ""
-        msgs = []
-        while not retval:
-            msgs.append(self.ser.readline().decode())
-        return msgs
+        """Clear and return the backlog of replies already received.
+
+        Only what has arrived is read, so this returns at once instead of
+        waiting out the serial timeout. Replies still on their way are not
+        cleared.
+        """
+        with self._lock:
+            data = bytes(self._rxbuf) + self.ser.read(self.ser.in_waiting)
+            self._rxbuf.clear()
+        return data.decode("ascii").splitlines(keepends=True)
 
-    def openserial(self, dev):
-        """Open serial connection."""
-        self.ser = serial.serial_for_url(dev, timeout=2)
-        self.sio = io.TextIOWrapper(
-            io.BufferedRWPair(self.ser, self.ser), newline="\r\n"
-        )
+    def openserial(self, dev, baudrate=9600):
+        """Open serial connection.
+
+        The elliptec protocol specifies 9600 baud, 8 data bits, 1 stop bit
+        and no parity, and the modules have no command to change it. Only
+        override `baudrate` for an adapter or bridge that requires it.
+        """
+        self.ser = serial.serial_for_url(dev, baudrate=baudrate, timeout=2)
+        self._rxbuf = bytearray()
+        # Queries are answered at once, so allow for a long reply on the
+        # wire (ten bit times per byte at 8N1) plus USB adapter latency
+        self._querytimeout = max(0.1, 128 * 10 / baudrate)
+        self._lowlatency()
+        # The Windows driver's default receive buffer can be small enough
+        # for the replies to a large batch to overflow it
+        if sys.platform == "win32":
+            try:
+                self.ser.set_buffer_size(rx_size=4096, tx_size=4096)
+            except AttributeError:
+                pass
+        # Discard anything queued before the port was opened, which would
+        # otherwise be read as the reply to the first query
+        sleep(0.1)
+        self.ser.reset_input_buffer()
+        self.ser.reset_output_buffer()
+        self._rxbuf.clear()
+
+    def _lowlatency(self):
+        """Ask the USB-serial adapter to deliver received bytes immediately.
+
+        FTDI adapters hold short replies for up to their latency timer
+        (16 ms by default on Linux) before passing them on, which adds to
+        every round-trip. On Linux this sets ASYNC_LOW_LATENCY through
+        pyserial and writes 1 ms to the adapter's latency_timer in sysfs.
+        Both are best effort. The ftdi_sio driver lowers the timer itself in
+        low latency mode, and the sysfs file is usually writable only by
+        root, so a warning is only given if both fail. Elsewhere nothing is
+        changed. The adapter forgets these settings when it is unplugged,
+        so they are applied every time the port is opened.
+        """
+        if not sys.platform.startswith("linux"):
+            return
+        try:
+            self.ser.set_low_latency_mode(True)
+            lowlatency = True
+        except (AttributeError, OSError, ValueError):
+            lowlatency = False
+        port = getattr(self.ser, "port", None)
+        if not port:
+            return
+        tty = os.path.basename(os.path.realpath(port))
+        timer = f"/sys/bus/usb-serial/devices/{tty}/latency_timer"
+        if not os.path.exists(timer):
+            return
+        try:
+            with open(timer, "w") as f:
+                f.write("1")
+        except OSError as e:
+            if lowlatency:
+                return
+            warnings.warn(
+                f"Could not lower the USB latency timer of {port} ({e}); "
+                "replies may be delayed by up to 16 ms"
+            )
 
     def close(self):
-        """Shut down the buffer and serial connection cleanly."""
+        """Shut down the serial connection cleanly."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
         self.ser.close()
 
-    def bufmsg(self, msg):
-        """Send message to module and wait on readline() for a response."""
-        self._sndmsg(msg)
-        retval = self.sio.readline()
-        return retval
+    def submit(self, function, *args, **kwargs):
+        """Run a method in the background, returning a Future for its result.
+
+        This lets the caller do other work while modules move:
+
+            f = e.submit(e.moveabsolute, "0", 45)
+            ...
+            f.result()
+
+        Submitted calls run one at a time, in order, on a single worker
+        thread, each holding the port for its whole run. A direct call made
+        meanwhile waits for the running call to finish rather than mixing
+        its commands in. Do not wait on a Future inside pipeline(), as the
+        submitted call cannot start until the block ends.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        return self._executor.submit(self._locked, function, *args, **kwargs)
+
+    def _locked(self, function, *args, **kwargs):
+        """Run function holding the port, for calls from submit()."""
+        with self._lock:
+            return function(*args, **kwargs)
+
+    def batchmsg(self, addrs, msgs, wait=False):
+        """Send messages to several modules, then collect all replies.
+
+        Every message is written before any reply is read, so the modules
+        work on their commands at the same time, in one round trip, instead
+        of one after another. Replies are matched up by address as they
+        arrive and returned in the order of `addrs`. Set `wait` for motion
+        commands to skip busy replies sent while the modules are moving.
+        """
+        with self.pipeline(wait) as replies:
+            for addr, msg in zip(addrs, msgs):
+                self.msg(addr, msg)
+        return replies
+
+    @contextmanager
+    def _timeout(self, timeout):
+        """Replace the serial timeout within the block, restoring it after.
+
+        The port is held for the block, so a call running in the background
+        keeps its own timeout. It is only reconfigured when the value
+        actually changes.
+        """
+        with self._lock:
+            oto = self.ser.timeout
+            if oto != timeout:
+                self.ser.timeout = timeout
+            try:
+                yield
+            finally:
+                if self.ser.timeout != oto:
+                    self.ser.timeout = oto
+
+    @contextmanager
+    def _direct(self, name):
+        """Hold the port for a method that writes and reads it directly.
+
+        Such methods would read replies meant for queued commands, so they
+        raise Error inside pipeline().
+        """
+        with self._lock:
+            if self._pending is not None:
+                raise Error(f"{name} cannot be pipelined")
+            yield
+
+    @contextmanager
+    def pipeline(self, wait=False):
+        """Send commands without waiting, and collect the replies at the end.
+
+        Inside the block, msg() queues each command and returns None instead
+        of waiting for the reply. Queued commands are written together when
+        the block ends, when flush() is called, or as soon as MAXBATCH are
+        queued. All replies are then read, matched to their commands by
+        address, and put into the list yielded by the context manager:
+
+            with e.pipeline() as replies:
+                e.pos("0")
+                e.pos("1")
+            # replies == ["0PO...", "1PO..."]
+
+        This suits methods which send one command through msg() and return
+        its reply: pos, status, information, motor1info, motor2info,
+        homeoffset, jogstep, home, stop, moverelative and the dumb
+        _moveabsolute, among others. Methods which read several replies or
+        check them and retry, i.e. moveabsolute, groupmove, homeall,
+        calmove, positions, motorinfo and searchfreqall, raise Error inside
+        the block. Set `wait` for motion commands to skip busy replies sent
+        while modules move. If the block raises, queued commands that have
+        not been written are dropped, and only the replies to those already
+        written are read.
+        """
+        with self._lock:
+            if self._pending is not None:
+                raise Error("Pipelines cannot be nested")
+            self._pending = []
+            replies = []
+            try:
+                yield replies
+            except BaseException:
+                # Drop the commands not written yet, so nothing more is sent
+                # once the block has failed
+                del self._pending[len(self._pending) - len(self._txbuf) :]
+                self._txbuf.clear()
+                raise
+            finally:
+                self.flush()
+                addrs = self._pending
+                self._pending = None
+                # Read replies even on error, so they are not taken as the
+                # replies to later commands
+                replies.extend(self._matchmsgs(addrs, len(addrs), wait))
+
+    def bufmsg(self, *parts, timeout=None):
+        """Send message to module and wait for a response.
+
+        The message may be given in parts, e.g. address prefix and command,
+        which are joined once for the write. A `timeout` replaces the serial
+        timeout while waiting for this reply, e.g. a short one for queries
+        which modules answer at once.
+        """
+        with self._lock:
+            self._sndmsg("".join(parts))
+            if timeout is None:
+                return self._readmsg()
+            with self._timeout(timeout):
+                return self._readmsg()
 
     def _sndmsg(self, msg):
-        """Send message to module without waiting for a response."""
+        """Send message to module without waiting for a response.
+
+        pyserial's write() hands the bytes to the OS synchronously, so no
+        flush is needed before reading the reply. Flushing (tcdrain on
+        POSIX) would block until the bytes physically leave the UART.
+        """
         # Cursed hack for some modules which reliably do no receive
-        # certain valid messages. Yes, it works.
+        # certain valid messages. Yes, it works. Here the flush is wanted
+        # so each character is on the wire before the pause.
         if self.slow_write:
-            for char in msg:
-                sleep(0.001)
-                self.sio.write(char)
-                self.sio.flush()
+            for char in msg.encode("ascii"):
+                sleep(self.slow_write_delay)
+                self.ser.write(bytes((char,)))
+                self.ser.flush()
         else:
-            self.sio.write(msg)
-            self.sio.flush()
+            self.ser.write(msg.encode("ascii"))
+
+    def flush(self):
+        """Write the commands queued inside pipeline() in a single call.
+
+        This happens automatically when the block ends, but calling it
+        earlier lets the modules start on the commands queued so far, e.g.
+        to begin a move while the next commands are being prepared. Outside
+        a pipeline nothing is queued and this does nothing.
+        """
+        with self._lock:
+            if self._txbuf:
+                self._sndmsg("".join(self._txbuf))
+                self._txbuf.clear()
 
     def _interceptcmd(self, function, args):
         """Print the command that would be sent via serial."""
-        tmpsio = self.sio
-        self.sio = Dummyio()
-        retval = function(*args)
-        self.sio = tmpsio
-        return retval
-
-    def msg(self, addr, msg):
-        """Send message to module."""
+        with self._lock:
+            tmpser, tmpbuf = self.ser, self._rxbuf
+            self.ser, self._rxbuf = Dummyio(), bytearray()
+            try:
+                return function(*args)
+            finally:
+                self.ser, self._rxbuf = tmpser, tmpbuf
+
+    def msg(self, addr, msg, timeout=None):
+        """Send message to module, see bufmsg for `timeout`."""
+        addr = self.parseaddr(addr)
+        with self._lock:
+            # Any command may move the module or fail, so its position is
+            # only known again once it is reported
+            self._poscache.pop(addr, None)
+            if self._pending is not None:
+                self._txbuf.append(self._addrprefix(addr) + msg)
+                self._pending.append(addr)
+                if len(self._txbuf) >= MAXBATCH:
+                    self.flush()
+                return None
+            return self.bufmsg(self._addrprefix(addr), msg, timeout=timeout)
+
+    def _cachedmsg(self, addr, msg, refresh=False):
+        """Send a query whose reply does not change, reusing earlier replies.
+
+        Only replies answering the query (e.g. "IN" for "in") are stored,
+        so errors and missing replies are retried on the next call. With
+        `refresh`, the module is queried even if a reply is stored.
+        """
         addr = self.parseaddr(addr)
-        addr = str(int(addr, 16))
-        return self.bufmsg(addr + msg)
+        key = (addr, msg)
+        # Inside a pipeline the query is always sent, so it gets a reply
+        if key in self._infocache and self._pending is None and not refresh:
+            return self._infocache[key]
+        retval = self.msg(addr, msg, timeout=self._querytimeout)
+        if retval and retval[1:3] == msg.upper():
+            self._infocache[key] = retval
+        return retval
 
-    def information(self, addr):
+    def information(self, addr, refresh=False):
         """Get information about module.
 
         Reply format:
@@ -245,21 +737,36 @@ class Elliptec:
                      rest is 7-bit hardware release
             TRAVEL - travel in mm/deg
             PULSES - pulses per measurement unit
+
+        The reply is fixed for the session, so it is cached after the first
+        successful query. Set `refresh` to query the module again.
         """
-        return self.handler(self.msg(addr, "in"))
+        return self.handler(self._cachedmsg(addr, "in", refresh))
+
+    def isinfo(self, retval):
+        """Check if retval is a complete module information reply."""
+        if retval.startswith("IN", 1) and len(retval.strip()) >= 33:
+            return True
+        else:
+            return False
 
     def initinfo(self, addr, info):
         """Parse and store module information string."""
-        self.info[addr] = {}
-        self.info[addr]["partnumber"] = int(info.strip()[3:5], 16)
-        self.info[addr]["serialnumber"] = int(info.strip()[5:13])
-        self.info[addr]["year"] = int(info.strip()[13:17])
-        self.info[addr]["fwrel"] = int(info.strip()[17:19])
-        self.info[addr]["hwrel"] = int(info.strip()[19:21])
-        self.info[addr]["travel"] = int(info.strip()[21:25], 16)
-        self.info[addr]["pulses"] = int(info.strip()[25:33], 16)
-
-    def motor1info(self, addr):
+        s = info.strip()
+        d = {name: int(s[i:j], base) for name, i, j, base in infofields}
+        self.storeinfo(addr, d)
+
+    def storeinfo(self, addr, d):
+        """Store parsed module information and derived scale factors."""
+        self.info[addr] = d
+        self._steps_per_deg[addr] = d["pulses"] / 360
+        self._steps_per_mm[addr] = float(d["pulses"])
+        # Indexed mounts report 0 pulses and have no inverse scale
+        if d["pulses"]:
+            self._deg_per_step[addr] = 360 / d["pulses"]
+            self._mm_per_step[addr] = 1 / d["pulses"]
+
+    def motor1info(self, addr, refresh=False):
         """Get motor 1 parameters from module.
 
         Reply format:
@@ -277,35 +784,72 @@ class Elliptec:
         FWDPER - forward period value
         BAKPER - backward period value
         period value - 14,740,000/frequency
+
+        The reply is cached until the frequency of motor 1 is searched, or
+        until `refresh` is set to query the module again.
         """
-        return self.handler(self.msg(addr, "i1"))
+        return self.handler(self._cachedmsg(addr, "i1", refresh))
 
-    def motor2info(self, addr):
+    def motor2info(self, addr, refresh=False):
         """Get motor 2 parameters from module.
 
-        Only applies for devices which have two motors.
+        Only applies for devices which have two motors. The reply is cached
+        until the frequency of motor 2 is searched, or until `refresh` is
+        set to query the module again.
+        """
+        return self.handler(self._cachedmsg(addr, "i2", refresh))
+
+    def motorinfo(self, addr, refresh=False):
+        """Get the parameters of every motor of a module.
+
+        The queries are sent as a batch, see batchmsg. Returns a list of
+        replies in motor order, cached like motor1info and motor2info
+        unless `refresh` is set.
         """
-        return self.handler(self.msg(addr, "i2"))
+        addr = self.parseaddr(addr)
+        if self.info[addr]["partnumber"] in modtype["linrot"]:
+            msgs = ["i1", "i2"]
+        else:
+            msgs = ["i1"]
+        if refresh:
+            ret = dict.fromkeys(msgs)
+        else:
+            ret = {msg: self._infocache.get((addr, msg)) for msg in msgs}
+        todo = [msg for msg in msgs if ret[msg] is None]
+        for msg, retval in zip(todo, self.batchmsg([addr] * len(todo), todo)):
+            if retval and retval[1:3] == msg.upper():
+                self._infocache[(addr, msg)] = retval
+            ret[msg] = retval
+        return [self.handler(ret[msg]) for msg in msgs]
 
     def storemotorinfo(self, addr, num, m):
         """Parse and store motor info for motor `num`."""
         addr = self.parseaddr(addr)
-        self.info[addr][num] = dict()
-        self.info[addr][num]["loop"] = int(m.strip()[3:4])
-        self.info[addr][num]["motor"] = int(m.strip()[4:5])
-        self.info[addr][num]["current"] = int(m.strip()[5:9], 16) / 1866
-        self.info[addr][num]["rampup"] = int(m.strip()[9:13], 16)
-        self.info[addr][num]["rampdown"] = int(m.strip()[13:17], 16)
-        self.info[addr][num]["forwardperiod"] = 14740000 / int(m.strip()[17:21], 16)
-        self.info[addr][num]["backwardperiod"] = 14740000 / int(m.strip()[21:25], 16)
+        s = m.strip()
+        self.info[addr][num] = {
+            "loop": int(s[3:4]),
+            "motor": int(s[4:5]),
+            "current": int(s[5:9], 16) / 1866,
+            "rampup": int(s[9:13], 16),
+            "rampdown": int(s[13:17], 16),
+            "forwardperiod": 14740000 / int(s[17:21], 16),
+            "backwardperiod": 14740000 / int(s[21:25], 16),
+        }
 
     def status(self, addr):
         """Get module status/error value and clear error."""
-        return self.handler(self.msg(addr, "gs"))
+        return self.handler(self.msg(addr, "gs", timeout=self._querytimeout))
 
     def isstatus(self, retval):
         """Check if retval is a status code."""
-        if retval[1:3] == "GS":
+        if retval.startswith("GS", 1):
+            return True
+        else:
+            return False
+
+    def isbusy(self, retval):
+        """Check if retval is a busy status, sent while a module is moving."""
+        if self.isstatus(retval) and retval[3:5] == format(BUSY, "02X"):
             return True
         else:
             return False
@@ -319,7 +863,16 @@ class Elliptec:
 
         Expected reply: GS00 from new address.
         """
-        return self.handler(self.msg(addr, "ca" + naddr))
+        addr = self.parseaddr(addr)
+        naddr = self.parseaddr(naddr)
+        for key in list(self._infocache):
+            if key[0] in (addr, naddr):
+                del self._infocache[key]
+        self._poscache.pop(naddr, None)
+        # Either address may change from free to used, so probe again
+        self._freecache = None
+        retval = self.msg(addr, "ca" + naddr, timeout=self._querytimeout)
+        return self.handler(retval)
 
     def saveuserdata(self, addr):
         """Instruct device to save motor parameters.
@@ -346,7 +899,8 @@ class Elliptec:
         from multiple devices are ordered by their address, with 0x0
         having priority.
         """
-        return self.handler(self.msg(addr, "ga" + gaddr))
+        retval = self.msg(addr, "ga" + gaddr, timeout=self._querytimeout)
+        return self.handler(retval)
 
     def cleanmechanics(self, addr):
         """Perform cleaning cycle on module (blocking).
@@ -357,10 +911,7 @@ class Elliptec:
         """
         addr = self.parseaddr(addr)
         if self.info[addr]["partnumber"] in modtype["optclean"]:
-            oto = self.ser.timeout
-            self.ser.timeout = 0
-            retval = self.msg(addr, "cm")
-            self.ser.timeout = oto
+            retval = self.msg(addr, "cm", timeout=0)
             return self.handler(retval)
         else:
             raise ModuleError("Command not supported for this module")
@@ -374,10 +925,7 @@ class Elliptec:
         """
         addr = self.parseaddr(addr)
         if self.info[addr]["partnumber"] in modtype["optclean"]:
-            oto = self.ser.timeout
-            self.ser.timeout = 0
-            retval = self.msg(addr, "om")
-            self.ser.timeout = oto
+            retval = self.msg(addr, "om", timeout=0)
             return self.handler(retval)
         else:
             raise ModuleError("Command not supported for this module")
@@ -395,10 +943,12 @@ class Elliptec:
 
     def searchfreq1(self, addr):
         """Scan and optimize resonant frequency of motor 1."""
+        self._infocache.pop((self.parseaddr(addr), "i1"), None)
         return self.handler(self.msg(addr, "s1"))
 
     def searchfreq2(self, addr):
         """Scan and optimize resonant frequency of motor 2."""
+        self._infocache.pop((self.parseaddr(addr), "i2"), None)
         return self.handler(self.msg(addr, "s2"))
 
     def searchfreq3(self, addr):
@@ -420,6 +970,32 @@ class Elliptec:
         else:
             raise ModuleError
 
+    def searchfreqall(self):
+        """Scan and optimize resonant frequencies of all connected modules.
+
+        Motor 1 of every module is scanned, then motor 2 of the linear and
+        rotary stages, each as a batch (see batchmsg). See searchfreq for
+        the per-module version.
+        """
+        motor1 = []
+        motor2 = []
+        for addr in self.addrs:
+            if self.info[addr]["partnumber"] in modtype["indexed"]:
+                motor1.append(addr)
+            elif self.info[addr]["partnumber"] in modtype["linrot"]:
+                motor1.append(addr)
+                motor2.append(addr)
+            else:
+                raise ModuleError
+        for msg, addrs in (("s1", motor1), ("s2", motor2)):
+            # A scan changes the motor info, see searchfreq1/2
+            for addr in addrs:
+                self._infocache.pop((addr, "i" + msg[1]), None)
+            replies = self.batchmsg(addrs, [msg] * len(addrs), wait=True)
+            for retval in replies:
+                if self.isstatus(retval) and self.parsestatus(retval) == MECH_TIMEOUT:
+                    raise ReportedError(errmsg[MECH_TIMEOUT])
+
     def homeoffset(self, addr):
         """Request the motor's home position.
 
@@ -430,19 +1006,38 @@ class Elliptec:
               for a convenient way to set an arbitrary offset for
               successive movements.
         """
-        return self.handler(self.msg(addr, "go"))
+        return self.handler(self.msg(addr, "go", timeout=self._querytimeout))
 
     def jogstep(self, addr):
         """Request jog length."""
-        return self.handler(self.msg(addr, "gj"))
+        return self.handler(self.msg(addr, "gj", timeout=self._querytimeout))
 
-    def pos(self, addr):
-        """Request current motor position."""
-        return self.handler(self.msg(addr, "gp"))
+    def pos(self, addr, cached=False):
+        """Request current motor position.
+
+        With `cached`, the position reported by the module at the end of
+        the last move or position request is returned without querying it,
+        if no other command has been sent to the module since. Only use
+        this if nothing else moves the modules.
+        """
+        addr = self.parseaddr(addr)
+        # Inside a pipeline the request is always sent, so it gets a reply
+        if cached and addr in self._poscache and self._pending is None:
+            return self.handler(self._poscache[addr])
+        retval = self.msg(addr, "gp", timeout=self._querytimeout)
+        return self.handler(self._notepos(addr, retval))
+
+    def _notepos(self, addr, retval):
+        """Remember a position reply from addr for pos(cached=True)."""
+        if retval and self.ispos(retval) and retval[0] == addr:
+            self._poscache[addr] = retval
+        else:
+            self._poscache.pop(addr, None)
+        return retval
 
     def ispos(self, ret):
         """Check if return string is position report."""
-        if ret[1:3] == "PO":
+        if ret.startswith("PO", 1):
             return True
         else:
             return False
@@ -455,6 +1050,32 @@ class Elliptec:
         """Convert pos retval to mm using queried scale factor."""
         return self.step2mm(addr, self.hex2step(retval[3:11]))
 
+    def positions(self, addrs=None):
+        """Request the positions of several modules at once.
+
+        The requests are sent as a batch, see batchmsg. Returns a dict from
+        address to position in degrees or mm, or in steps for indexed
+        modules, with None for a module that did not report its position.
+        Defaults to all initialized modules.
+        """
+        if addrs is None:
+            addrs = self.addrs
+        addrs = [self.parseaddr(addr) for addr in addrs]
+        with self._timeout(self._querytimeout):
+            replies = self.batchmsg(addrs, ["gp"] * len(addrs))
+        ret = {}
+        for addr, retval in zip(addrs, replies):
+            retval = self._notepos(addr, self.handler(retval))
+            if not (retval and self.ispos(retval)):
+                ret[addr] = None
+            elif self.info[addr]["partnumber"] in modtype["rotary"]:
+                ret[addr] = self.pos2deg(addr, retval)
+            elif self.info[addr]["partnumber"] in modtype["linear"]:
+                ret[addr] = self.pos2mm(addr, retval)
+            else:
+                ret[addr] = self.hex2step(retval[3:11])
+        return ret
+
     def home(self, addr, direction=CCW):
         """Move motor to home position.
 
@@ -463,10 +1084,10 @@ class Elliptec:
         """
         addr = self.parseaddr(addr)
         if self.info[addr]["partnumber"] in modtype["linrot"]:
-            if direction == CW:
-                return self.handler(self.msg(addr, "ho0"))
-            else:
-                return self.handler(self.msg(addr, "ho1"))
+            # Hold the port until the reply ending the move is read
+            with self._lock:
+                retval = self._waitmove(self.msg(addr, homecmd[direction]))
+            return self.handler(self._notepos(addr, retval))
         elif self.info[addr]["partnumber"] in modtype["indexed"]:
             # These do not obey home
             return self.indexmove(addr, 0)
@@ -474,24 +1095,61 @@ class Elliptec:
             return self.handler(self.msg(addr, "ho"))
 
     def homeall(self, direction=CCW):
-        """Home all connected modules."""
-        for addr in self.addrs:
-            self.home(addr, direction)
+        """Home all connected modules.
+
+        Linear and rotary stages are given a group address and homed with
+        a single command, if there are several and an address is confirmed
+        free by _freeaddrs, so no module left out of addrs is homed. The
+        other modules' commands follow in the same write, see batchmsg.
+        See home for the per-module command.
+        """
+        with self._direct("homeall"):
+            linrot = [
+                a for a in self.addrs if self.info[a]["partnumber"] in modtype["linrot"]
+            ]
+            # Only probe for a group address when there is a group to home
+            free = self._freeaddrs() if len(linrot) > 1 else []
+            cmds = []
+            if free:
+                gaddr = free[0]
+                for addr in linrot:
+                    cmds.append(f"{self._addrprefix(addr)}ga{gaddr}")
+                ngroup = len(cmds)
+                cmds.append(self._addrprefix(gaddr) + homecmd[direction])
+            else:
+                linrot = []
+                ngroup = 0
+            for addr in self.addrs:
+                if addr in linrot:
+                    continue
+                if self.info[addr]["partnumber"] in modtype["linrot"]:
+                    msg = homecmd[direction]
+                elif self.info[addr]["partnumber"] in modtype["indexed"]:
+                    msg = "ma" + self.step2hex(self.idx2step(addr, 0))
+                else:
+                    msg = "ho"
+                cmds.append(self._addrprefix(addr) + msg)
+            self._sndmsg("".join(cmds))
+            # Replies to ga come from the group address and are only counted
+            replies = self._matchmsgs(self.addrs, ngroup + len(self.addrs), wait=True)
+            return [
+                self.handler(self._notepos(a, r)) for a, r in zip(self.addrs, replies)
+            ]
 
     def deg2step(self, addr, deg):
         """Convert degrees to steps using queried scale factor."""
         addr = self.parseaddr(addr)
-        return int(deg * self.info[addr]["pulses"] / 360)
+        return int(deg * self._steps_per_deg[addr])
 
     def step2deg(self, addr, step):
         """Convert steps to degrees using queried scale factor."""
         addr = self.parseaddr(addr)
-        return step * 360 / self.info[addr]["pulses"]
+        return step * self._deg_per_step[addr]
 
     def mm2step(self, addr, mm):
         """Convert mm to steps using queried scale factor."""
         addr = self.parseaddr(addr)
-        return int(mm * self.info[addr]["pulses"])
+        return int(mm * self._steps_per_mm[addr])
 
     def idx2step(self, addr, idx):
         """Convert index to steps using ad-hoc index protocol.
@@ -536,7 +1194,7 @@ class Elliptec:
         """Convert steps to mm using queried scale factor."""
         addr = self.parseaddr(addr)
         if self.info[addr]["partnumber"] not in modtype["indexed"]:
-            return step / self.info[addr]["pulses"]
+            return step * self._mm_per_step[addr]
         else:
             return step
 
@@ -545,10 +1203,7 @@ class Elliptec:
         """Convert hex-encoded int32 to python int."""
         if len(x) != 8:
             raise ValueError
-        y = int(x, 16)
-        if y > 1 << (32 - 1):
-            y -= 1 << 32
-        return y
+        return int.from_bytes(bytes.fromhex(x), "big", signed=True)
 
     @staticmethod
     def step2hex(step):
@@ -556,65 +1211,155 @@ class Elliptec:
 
         Note that [a-f] are NOT accepted as valid hex values by the
         module controllers. To make step2hex and hex2step bijective, we
-        consider negative values as well.
+        consider negative values as well, masking them to their 32-bit
+        two's complement.
         """
-        if step < 0:
-            step += 1 << 32
-        return hex(step)[2:].zfill(8).upper()
+        return format(step & 0xFFFFFFFF, "08X")
 
-    def _moveabsolute(self, addr, pos):
-        """Move motor to specified absolute position (dumb version)."""
+    def _targetstep(self, addr, pos):
+        """Convert an absolute position to steps for the module at addr."""
         addr = self.parseaddr(addr)
         if self.info[addr]["partnumber"] in modtype["rotary"]:
-            step = self.deg2step(addr, pos)
+            return self.deg2step(addr, pos)
         elif self.info[addr]["partnumber"] in modtype["linear"]:
-            step = self.mm2step(addr, pos)
+            return self.mm2step(addr, pos)
         elif self.info[addr]["partnumber"] in modtype["indexed"]:
-            step = self.idx2step(addr, pos)
+            return self.idx2step(addr, pos)
         else:
             raise ModuleError
-        hstep = self.step2hex(step)
-        return self.handler(self.msg(addr, "ma" + hstep))
 
-    def moveabsolute(self, addr, pos, depth=1):
-        """Move motor to specified absolute position."""
+    def _moveabsolute(self, addr, pos):
+        """Move motor to specified absolute position (dumb version)."""
         addr = self.parseaddr(addr)
-        ret = self._moveabsolute(addr, pos)
-        # Indexed mounts only report status for position 0
-        if self.info[addr]["partnumber"] in modtype["indexed"]:
-            return ret
-        # Check if we should give up
-        if depth > 5:
-            errstr = "Moveabsolute unsuccessful after 5 tries:\n"
-            for flag in self.flags:
-                errstr += " " + flagmsg[flag] + "\n"
-            raise ReportedError(errstr)
-        # Command was not received, need to retry
-        if ret == "":
-            self.flags.append(CMD_NOT_RCVD)
-            # If valid message was sent but no reply was received, we
-            # need to use slow_write for module to hear us
-            self.slow_write = True
-            return self.moveabsolute(addr, pos, depth=(depth + 1))
-        # Check reported position and retry if not within error
-        elif self.ispos(ret) and (ret[0] == addr):
-            if self.info[addr]["partnumber"] in modtype["rotary"]:
-                if abs(self.pos2deg(addr, ret) - pos) > DEGERR:
-                    self.flags.append(POS_ERROR)
-                    return self.moveabsolute(addr, pos, depth=(depth + 1))
-                else:
+        step = self._targetstep(addr, pos)
+        with self._lock:
+            retval = self._waitmove(self.msg(addr, f"ma{self.step2hex(step)}"))
+        return self.handler(self._notepos(addr, retval))
+
+    def inposition(self, addr, ret, pos):
+        """Check if position reply from addr is within MMERR/DEGERR of pos."""
+        addr = self.parseaddr(addr)
+        if not (self.ispos(ret) and (ret[0] == addr)):
+            return False
+        if self.info[addr]["partnumber"] in modtype["rotary"]:
+            return abs(self.pos2deg(addr, ret) - pos) <= DEGERR
+        else:
+            return abs(self.pos2mm(addr, ret) - pos) <= MMERR
+
+    def moveabsolute(self, addr, pos, depth=1):
+        """Move motor to specified absolute position.
+
+        The move is retried until the module reports a position within
+        MMERR/DEGERR of `pos`, making up to five retries after the first
+        attempt (counting from `depth`).
+        """
+        with self._direct("moveabsolute"):
+            addr = self.parseaddr(addr)
+            # Indexed mounts only report status for position 0
+            indexed = self.info[addr]["partnumber"] in modtype["indexed"]
+            posreply = addr + "PO"
+            while True:
+                ret = self._moveabsolute(addr, pos)
+                if indexed:
                     return ret
-            else:
-                if abs(self.pos2mm(addr, ret) - pos) > MMERR:
+                # Address and reply code, sliced once for the checks below
+                head = ret[:3]
+                # Command was not received, need to retry
+                if not head:
+                    self.flags.append(CMD_NOT_RCVD)
+                    # If valid messages keep getting no reply, we need to use
+                    # slow_write for module to hear us. A single lost reply is
+                    # more likely a glitch, and once on, slow_write slows every
+                    # later command.
+                    self._missed += 1
+                    if self._missed >= MISSLIMIT:
+                        self.slow_write = True
+                else:
+                    self._missed = 0
+                # Check reported position and retry if not within error
+                if head == posreply:
+                    if self.inposition(addr, ret, pos):
+                        return ret
                     self.flags.append(POS_ERROR)
-                    return self.moveabsolute(addr, pos, depth=(depth + 1))
+                # Pass on a reported error
+                elif head[1:] == "GS":
+                    raise ReportedError(errmsg[self.parsestatus(ret)])
+                elif head:
+                    raise Error("moveabsolute unsuccessful")
+                # Check if we should give up
+                if depth > 5:
+                    errstr = "Moveabsolute unsuccessful after 5 tries:\n"
+                    for flag in self.flags:
+                        errstr += " " + flagmsg[flag] + "\n"
+                    raise ReportedError(errstr)
+                depth += 1
+
+    def _freeaddrs(self):
+        """Return the addresses 0-9 not used by a module, highest first.
+
+        These serve as group addresses. A-F are left out as the address is
+        sent in decimal. A module that was not listed in addrs may still be
+        on the bus, so the first call sends "in" to every other address and
+        leaves out any that reply.
+        """
+        if self._freecache is None:
+            unused = [a for a in "9876543210" if a not in self.addrs]
+            with self._timeout(self._querytimeout):
+                replies = self.batchmsg(unused, ["in"] * len(unused))
+            self._freecache = [a for a, r in zip(unused, replies) if not r]
+        return [a for a in self._freecache if a not in self.addrs]
+
+    def groupmove(self, addrs, xs, gaddr=None):
+        """Move modules at `addrs` to absolute positions `xs` simultaneously.
+
+        Modules whose targets convert to the same step count are assigned
+        a group address and moved with a single command. All commands are
+        sent in one write, see batchmsg. Any module that does not report a
+        position within MMERR/DEGERR of its target is then moved
+        individually with moveabsolute.
+
+        If no group address is given, unused addresses in 0-9 are used,
+        highest first, one for each group of modules sharing a target.
+        """
+        with self._direct("groupmove"):
+            addrs = [self.parseaddr(addr) for addr in addrs]
+            if gaddr is None:
+                free = self._freeaddrs()
+            else:
+                gaddr = self.parseaddr(gaddr)
+                if gaddr in self.addrs:
+                    raise Error(f"Group address {gaddr} is used by a module")
+                free = [gaddr]
+            groups = dict()
+            for addr, x in zip(addrs, xs):
+                groups.setdefault(self._targetstep(addr, x), []).append(addr)
+            # Group addresses are assigned ahead of the moves in the same write.
+            # Modules process the bus in order, so each one has joined its group
+            # before the move addressed to it.
+            gcmds = []
+            cmds = []
+            for step, members in groups.items():
+                if len(members) > 1 and free:
+                    gaddr = free.pop(0)
+                    for addr in members:
+                        gcmds.append(f"{self._addrprefix(addr)}ga{gaddr}")
+                    cmds.append(f"{self._addrprefix(gaddr)}ma{self.step2hex(step)}")
                 else:
-                    return ret
-        # Pass on a reported error
-        elif self.isstatus(ret):
-            raise ReportedError(errmsg[self.parsestatus(ret)])
-        else:
-            raise Error("moveabsolute unsuccessful")
+                    for addr in members:
+                        cmds.append(f"{self._addrprefix(addr)}ma{self.step2hex(step)}")
+            # One write for the whole batch, so the moves start back-to-back
+            self._sndmsg("".join(gcmds + cmds))
+            # Replies to ga come from the group address, so they are counted
+            # but not matched to any module
+            replies = self._matchmsgs(addrs, len(gcmds) + len(addrs), wait=True)
+            ret = [self.handler(self._notepos(a, r)) for a, r in zip(addrs, replies)]
+            for i, (addr, x) in enumerate(zip(addrs, xs)):
+                if self.info[addr]["partnumber"] in modtype["indexed"]:
+                    if not ret[i]:
+                        ret[i] = self.moveabsolute(addr, x)
+                elif not self.inposition(addr, ret[i], x):
+                    ret[i] = self.moveabsolute(addr, x)
+            return ret
 
     def moverelative(self, addr, delta):
         """Move motor relative to current position."""
@@ -625,8 +1370,9 @@ class Elliptec:
             step = self.mm2step(addr, delta)
         else:
             raise ModuleError
-        hstep = self.step2hex(step)
-        return self.handler(self.msg(addr, "mr" + hstep))
+        with self._lock:
+            retval = self._waitmove(self.msg(addr, f"mr{self.step2hex(step)}"))
+        return self.handler(self._notepos(addr, retval))
 
     def setcal(self, *args):
         """Set a calibration offset for modules `addrs` to `xs`.
@@ -644,12 +1390,14 @@ class Elliptec:
             xs = args[1]
         else:
             raise TypeError("Too many arguments")
-        try:
+        # Positions are never strings, so any iterable is a list of them
+        if hasattr(xs, "__iter__"):
             for addr, x in zip(addrs, xs):
-                addr = self.parseaddr(addr)
-                self.zero[addr] = x
-        except TypeError:
-            self.zero[addrs] = xs
+                self.zero[self.parseaddr(addr)] = x
+        else:
+            if not isinstance(addrs, (str, int)):
+                addrs = addrs[0]
+            self.zero[self.parseaddr(addrs)] = xs
 
     def calmove(self, *args):
         """Move module at addr to position x relative to calibration offset.
@@ -665,19 +1413,24 @@ class Elliptec:
             xs = args[1]
         else:
             raise TypeError("Too many arguments")
-        if type(xs) is list:
-            ret = []
+        # Positions are never strings, so any iterable is a list of them
+        if hasattr(xs, "__iter__"):
+            ys = []
             for addr, x in zip(addrs, xs):
                 addr = self.parseaddr(addr)
                 if self.info[addr]["partnumber"] in modtype["rotary"]:
-                    y = (self.zero[addr] + x) % 360
+                    ys.append((self.zero[addr] + x) % 360)
                 else:
-                    y = self.zero[addr] + x
-                ret.append(self.moveabsolute(addr, y))
-            return ret
+                    ys.append(self.zero[addr] + x)
+            # Modules sharing a target can be moved simultaneously
+            if len(addrs) > 1:
+                return self.groupmove(addrs, ys)
+            return [self.moveabsolute(addr, y) for addr, y in zip(addrs, ys)]
         else:
             x = xs
-            addr = addrs[0]
+            if not isinstance(addrs, (str, int)):
+                addrs = addrs[0]
+            addr = self.parseaddr(addrs)
             if self.info[addr]["partnumber"] in modtype["rotary"]:
                 y = (self.zero[addr] + x) % 360
             else:
@@ -718,16 +1471,27 @@ class Elliptec:
 
 
 class Dummyio:
-    """Dummy io object to intercept writes and return them via readline."""
+    """Dummy serial object to intercept writes and return them via reads."""
+
+    def __init__(self):
+        self.lastmsg = b""
+        self.timeout = None
+
+    @property
+    def in_waiting(self):
+        """Number of intercepted bytes not yet read back."""
+        return len(self.lastmsg)
 
     def write(self, msg):
-        """Store the message instead of writing it to io."""
-        self.lastmsg = msg
+        """Store the message instead of writing it to the serial port."""
+        self.lastmsg += msg
 
     def flush(self):
-        """No-op to fake being io object."""
+        """No-op to fake being serial object."""
         pass
 
-    def readline(self):
-        """Return the stored message that was intercepted."""
-        return self.lastmsg
+    def read(self, size=1):
+        """Return up to `size` bytes of the message that was intercepted."""
+        msg = self.lastmsg[:size]
+        self.lastmsg = self.lastmsg[size:]
+        return msg